@@ -0,0 +1,206 @@
+import os
+import glob
+import random
+import cPickle
+import logging
+from math import log
+
+logger = logging.getLogger(__name__)
+
+
+class Leaderboard:
+    """Keeps all known users ranked by score.
+
+    Users are ordered by descending score, ties are broken by username. Every
+    update is O(log n), so we never have to sort all users for a query.
+    """
+
+    def __init__(self, expected_size=65536):
+        self.scores = {}
+        self.index = IndexableSkiplist(expected_size)
+
+    def __len__(self):
+        return len(self.scores)
+
+    @classmethod
+    def from_archive(cls, path='archive'):
+        """Build a leaderboard from all stored user files in one pass."""
+        scores = {}
+        for filename in glob.glob(os.path.join(path, '*.user')):
+            try:
+                with open(filename, 'rb') as f:
+                    tmp_dict = cPickle.load(f)
+            except Exception, e:
+                logger.warning("Could not read user file '%s': %s" %
+                               (filename, e))
+                continue
+            username = tmp_dict.get('username')
+            if not username:
+                continue
+            scores[username] = tmp_dict.get('score', 0)
+
+        board = cls(max(len(scores) * 2, 65536))
+        board.scores = scores
+        keys = sorted(cls._key(u, s) for u, s in scores.iteritems())
+        board.index = IndexableSkiplist.from_sorted(keys, board.index.expected)
+        logger.info("Leaderboard rebuilt with %i users." % len(scores))
+        return board
+
+    @staticmethod
+    def _key(username, score):
+        return (-score, username)
+
+    def update(self, username, score):
+        if username in self.scores:
+            if self.scores[username] == score:
+                return
+            self.index.remove(self._key(username, self.scores[username]))
+        self.scores[username] = score
+        self.index.insert(self._key(username, score))
+
+    def rank(self, username):
+        """Returns the 1-based rank of username, or None if unknown."""
+        if username not in self.scores:
+            return None
+        return self.index.index(self._key(username,
+                                          self.scores[username])) + 1
+
+    def top(self, count):
+        """Returns a list of (rank, username, score) for the best users."""
+        return self._entries(0, count)
+
+    def around(self, username, radius=2):
+        """Returns the entries around username, username included."""
+        rank = self.rank(username)
+        if rank is None:
+            return []
+        start = max(rank - 1 - radius, 0)
+        return self._entries(start, rank + radius)
+
+    def _entries(self, start, stop):
+        entries = []
+        for i, key in enumerate(self.index.slice(start, stop)):
+            entries.append((start + i + 1, key[1], -key[0]))
+        return entries
+
+
+class _Node(object):
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, levels):
+        self.key = key
+        self.next = [None] * levels
+        self.width = [1] * levels
+
+
+class IndexableSkiplist:
+    """A sorted collection of unique keys with O(log n) access by position.
+
+    Every link stores the number of positions it skips, which is what allows
+    us to look up ranks and positions without walking the whole list. Links
+    without a successor point past the last key.
+    """
+
+    def __init__(self, expected_size=65536):
+        self.expected = expected_size
+        self.size = 0
+        self.maxlevels = int(1 + log(max(expected_size, 2), 2))
+        self.head = _Node(None, self.maxlevels)
+
+    def __len__(self):
+        return self.size
+
+    @classmethod
+    def from_sorted(cls, keys, expected_size=65536):
+        """Build a skiplist from sorted, unique keys in linear time."""
+        sl = cls(expected_size)
+        last = [sl.head] * sl.maxlevels
+        lastpos = [-1] * sl.maxlevels
+        for pos, key in enumerate(keys):
+            node = _Node(key, sl._random_level())
+            for level in range(len(node.next)):
+                last[level].next[level] = node
+                last[level].width[level] = pos - lastpos[level]
+                last[level] = node
+                lastpos[level] = pos
+        sl.size = len(keys)
+        for level in range(sl.maxlevels):
+            last[level].width[level] = sl.size - lastpos[level]
+        return sl
+
+    def _random_level(self):
+        level = 1
+        while level < self.maxlevels and random.random() < 0.5:
+            level += 1
+        return level
+
+    def _find(self, key):
+        # For every level, find the last node before key and its position.
+        chain = [None] * self.maxlevels
+        positions = [0] * self.maxlevels
+        node = self.head
+        pos = -1
+        for level in reversed(range(self.maxlevels)):
+            while (node.next[level] is not None and
+                   node.next[level].key < key):
+                pos += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+            positions[level] = pos
+        return chain, positions
+
+    def insert(self, key):
+        chain, positions = self._find(key)
+        node = _Node(key, self._random_level())
+        newpos = positions[0] + 1
+        for level in range(len(node.next)):
+            prev = chain[level]
+            node.next[level] = prev.next[level]
+            prev.next[level] = node
+            steps = newpos - positions[level]
+            node.width[level] = prev.width[level] - steps + 1
+            prev.width[level] = steps
+        for level in range(len(node.next), self.maxlevels):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, key):
+        chain, positions = self._find(key)
+        node = chain[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+        for level in range(len(node.next)):
+            prev = chain[level]
+            prev.width[level] += node.width[level] - 1
+            prev.next[level] = node.next[level]
+        for level in range(len(node.next), self.maxlevels):
+            chain[level].width[level] -= 1
+        self.size -= 1
+
+    def index(self, key):
+        chain, positions = self._find(key)
+        node = chain[0].next[0]
+        if node is None or node.key != key:
+            raise ValueError(key)
+        return positions[0] + 1
+
+    def _node_at(self, i):
+        if i < 0 or i >= self.size:
+            raise IndexError(i)
+        node = self.head
+        i += 1
+        for level in reversed(range(self.maxlevels)):
+            while node.width[level] <= i:
+                i -= node.width[level]
+                node = node.next[level]
+        return node
+
+    def slice(self, start, stop):
+        """Yields the keys from position start up to (not including) stop."""
+        stop = min(stop, self.size)
+        if start >= stop:
+            return
+        node = self._node_at(start)
+        for _ in range(stop - start):
+            yield node.key
+            node = node.next[0]
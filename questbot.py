@@ -7,6 +7,7 @@ from twisted.python import log
 #from quest import Quest
 from users import (User, AccountAlreadyCreatedException,
                    UnknownHostmaskException)
+from leaderboard import Leaderboard
 
 # system imports
 import time
@@ -15,6 +16,8 @@ import argparse
 import hashlib
 import datetime
 import functools
+import cProfile
+import pstats
 
 
 class QuestBot(irc.IRCClient):
@@ -24,6 +27,7 @@ class QuestBot(irc.IRCClient):
     nickname = ''
     admin_override = ''
     admins = []
+    leaderboard = None
 
     # DECORATORS
 
@@ -171,6 +175,8 @@ class QuestBot(irc.IRCClient):
         if 'obj' not in self.users[nick]:
             try:
                 self.users[nick]['obj'] = User(nick, hostmask)
+                self.leaderboard.update(self.users[nick]['obj'].username,
+                                        self.users[nick]['obj'].score)
                 log.msg("User with nickname '%s' recognised as '%s'." %
                         (nick, self.users[nick]['obj'].username))
             except UnknownHostmaskException:
@@ -301,6 +307,57 @@ class QuestBot(irc.IRCClient):
         else:
             self.msg(user, 'User %s is not correctly registered (yet).' % nick)
 
+    def handle_admincmd_setscore(self, user, msg):
+        # Usage: setscore <nick> <score>
+        try:
+            tmpmsg = msg.split()
+            nick = tmpmsg[1]
+            score = int(tmpmsg[2])
+        except (IndexError, ValueError):
+            self.msg(user, 'Usage: setscore <nick> <score>')
+            return
+
+        if (nick in self.users) and ('obj' in self.users[nick]):
+            self._set_score(self.users[nick]['obj'], score)
+            self.msg(user, 'User %s now has a score of %i.' % (nick, score))
+        else:
+            self.msg(user, 'User %s is not correctly registered (yet).' % nick)
+
+    def handle_admincmd_profile(self, user, msg):
+        # Usage: profile [<seconds>]
+        # Profiling only costs anything while it is running.
+        max_seconds = 600
+        try:
+            tmpmsg = msg.split()
+            seconds = int(tmpmsg[1]) if len(tmpmsg) > 1 else 30
+        except ValueError:
+            self.msg(user, 'Usage: profile [<seconds>]')
+            return
+
+        # The profiler hook is process-wide, so the factory keeps track of
+        # it; a reconnect must not allow a second capture.
+        factory = self.factory
+        if factory.profiler is not None:
+            self.msg(user, "Already profiling, use 'profilestop' first.")
+            return
+
+        seconds = min(max(seconds, 1), max_seconds)
+        factory.profiler = cProfile.Profile()
+        factory.profiler.enable()
+        factory.profile_call = reactor.callLater(seconds,
+                                                 factory.stop_profile, user)
+        log.msg("User '%s' started profiling for %i seconds." %
+                (user, seconds))
+        self.msg(user, 'Profiling for %i seconds.' % seconds)
+
+    def handle_admincmd_profilestop(self, user, msg):
+        # Stop a running profile before its time is up.
+        if self.factory.profiler is None:
+            self.msg(user, 'Not profiling at the moment.')
+            return
+        self.factory.profile_call.cancel()
+        self.factory.stop_profile(user)
+
     def handle_admincmd_adminhelp(self, user, msg):
         # Return helpful information
         with open('help/adminhelp.txt', 'r') as helpfile:
@@ -394,6 +451,7 @@ class QuestBot(irc.IRCClient):
         if userobj.pwhash == pwd:
             userobj.add_hostmask(self.users[nick]['hostmask'])
             self.users[nick]['obj'] = userobj
+            self.leaderboard.update(userobj.username, userobj.score)
             self.msg(user, "Password recognised. You've been logged in and " +
                      "your hostmask has been added to the known list.")
             log.msg("User '%s' has succesfully logged in as '%s'." % (user,
@@ -412,14 +470,50 @@ class QuestBot(irc.IRCClient):
         else:
             self.msg(user, 'You are not logged in.')
 
+    def handle_cmd_top(self, user, msg):
+        # Usage: top [<count>|me]
+        for line in self._top_lines(user, msg.split()[1:]):
+            self.msg(user, line)
+
     def handle_pubcmd_help(self, channel, user, msg):
         # Return helpful information, but do it in a query
         self.msg(channel, ("%s: That's a lot of information, sending it in a" +
                  " query.") % user)
         self.handle_cmd_help(user, '')
 
+    def handle_pubcmd_top(self, channel, user, msg):
+        # Usage: <bot>: top [<count>|me]
+        for line in self._top_lines(user, msg.split()[2:]):
+            self.msg(channel, "%s: %s" % (user, line))
+
     # Helper functions
 
+    def _set_score(self, userobj, score):
+        # Always change scores through here, so the ranking stays current.
+        userobj.set_score(score)
+        self.leaderboard.update(userobj.username, score)
+
+    def _top_lines(self, user, args):
+        # The maximum number of entries we list, to avoid flooding.
+        max_count = 10
+        if args and args[0] == 'me':
+            if (user in self.users) and ('obj' in self.users[user]):
+                username = self.users[user]['obj'].username
+            else:
+                username = user
+            entries = self.leaderboard.around(username)
+            if not entries:
+                return ['You are not ranked yet.']
+        else:
+            try:
+                count = int(args[0]) if args else 5
+            except ValueError:
+                return ['Usage: top [<count>|me]']
+            entries = self.leaderboard.top(min(max(count, 1), max_count))
+            if not entries:
+                return ['Nobody is ranked yet.']
+        return ['%i. %s (%i)' % entry for entry in entries]
+
     def _log_error(self, msg):
         log.msg("Something went wrong: %s" % msg)
 
@@ -438,16 +532,55 @@ class QuestBotFactory(protocol.ClientFactory):
         self.channel = channel
         self.nick = nick
         self.admin = admin
+        # Rank all stored users once, after that we update incrementally.
+        self.leaderboard = Leaderboard.from_archive()
+        # A running profile outlives reconnects, so it is kept here.
+        self.profiler = None
+        self.profile_call = None
+        # The protocol for the current connection, if any.
+        self.protocol = None
 
     def buildProtocol(self, addr):
         p = QuestBot()
         p.factory = self
         p.nickname = self.nick
         p.admin_override = self.admin
+        p.leaderboard = self.leaderboard
+        self.protocol = p
         return p
 
+    def stop_profile(self, user):
+        """Stop the running profile, save it and report to user."""
+        # Number of functions we report back to the admin.
+        summary_count = 10
+        self.profiler.disable()
+        profiler = self.profiler
+        self.profiler = None
+        self.profile_call = None
+
+        filename = time.strftime('questbot-%Y%m%d-%H%M%S.prof')
+        profiler.dump_stats(filename)
+        log.msg("Profile written to '%s'." % filename)
+
+        stats = pstats.Stats(profiler)
+        stats.sort_stats('cumulative')
+        lines = ['Profile written to %s, top %i by cumulative time:' %
+                 (filename, summary_count)]
+        for func in stats.fcn_list[:summary_count]:
+            cc, nc, tt, ct, callers = stats.stats[func]
+            lines.append('%.3fs %ix %s' % (ct, nc,
+                                           pstats.func_std_string(func)))
+
+        # Reply through the current connection, we may have reconnected.
+        if self.protocol is None:
+            log.msg("Not connected, profile summary not sent to '%s'." % user)
+            return
+        for line in lines:
+            self.protocol.msg(user, line)
+
     def clientConnectionLost(self, connector, reason):
         """If we get disconnected, reconnect to server."""
+        self.protocol = None
         connector.connect()
 
     def clientConnectionFailed(self, connector, reason):
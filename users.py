@@ -27,6 +27,7 @@ class User:
     username = ''
     currentNick = ''
     is_admin = False
+    score = 0
     current_hostmask = ''
     hostmasks = []
 
@@ -91,6 +92,11 @@ class User:
         self.save()
         logger.info("User %s has been made an admin." % self.username)
 
+    def set_score(self, score):
+        self.score = score
+        self.save()
+        logger.info("User %s now has a score of %i." % (self.username, score))
+
     def set_pw_hash(self, pwhash, replace=False):
         if not replace and hasattr(self, 'pwhash'):
             raise AccountAlreadyCreatedException('Account already has a ' +